@@ -0,0 +1,9 @@
+import os
+
+# Gunicorn respawns workers that die, unlike uvicorn's own --workers supervisor
+bind = "0.0.0.0:8000"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+
+# Startup loads the embedding model, which can take a while on first run
+timeout = 120
\ No newline at end of file
@@ -1,15 +1,43 @@
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException
+from fastapi import FastAPI, Request, UploadFile, File, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List, Dict
-import json
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import select, insert, null
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import asynccontextmanager
+from typing import BinaryIO, List, Dict
+import asyncio
+import orjson
+import os
+import shutil
+import tempfile
 
-from database import get_db, Document, Workflow, ChatHistory
+from database import engine, init_db, get_db, SessionLocal, Document, Workflow, ChatHistory
 from services.document_processor import DocumentProcessor
 from services.embedding_service import EmbeddingService
 from services.workflow_executor import WorkflowExecutor
 
-app = FastAPI(title="AI Workflow Builder API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Services are built per worker process so each gets its own clients
+    app.state.doc_processor = DocumentProcessor()
+    app.state.embedding_service = EmbeddingService()
+    app.state.workflow_executor = WorkflowExecutor(embedding_service=app.state.embedding_service)
+    
+    await init_db()
+    await asyncio.to_thread(app.state.embedding_service.warmup)
+    yield
+    await app.state.workflow_executor.llm_service.close()
+    await app.state.embedding_service.close()
+    await engine.dispose()
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+processing_semaphore = asyncio.Semaphore(os.cpu_count() or 1)
+
+app = FastAPI(
+    title="AI Workflow Builder API",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
 
 # CORS
 app.add_middleware(
@@ -20,10 +48,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Services
-doc_processor = DocumentProcessor()
-embedding_service = EmbeddingService()
-workflow_executor = WorkflowExecutor()
+def spool_upload(source: BinaryIO):
+    """Copy an upload into a named temporary file in chunks"""
+    tmp = tempfile.NamedTemporaryFile(suffix=".pdf")
+    try:
+        shutil.copyfileobj(source, tmp, UPLOAD_CHUNK_SIZE)
+        tmp.flush()
+    except:
+        tmp.close()
+        raise
+    return tmp
+
+def format_event(data: Dict) -> str:
+    """Format a server-sent event"""
+    return f"data: {orjson.dumps(data).decode()}\n\n"
+
+async def save_chat_history(db: AsyncSession, workflow_id: int, query: str, result: Dict):
+    """Store the user query and assistant response for a workflow"""
+    await db.execute(insert(ChatHistory), [
+        {
+            "workflow_id": workflow_id,
+            "role": "user",
+            "content": query,
+            "meta": null()
+        },
+        {
+            "workflow_id": workflow_id,
+            "role": "assistant",
+            "content": result["response"],
+            "meta": result.get("metadata", {})
+        }
+    ])
+    await db.commit()
 
 @app.get("/")
 def read_root():
@@ -31,30 +87,34 @@ def read_root():
 
 @app.post("/api/documents/upload")
 async def upload_document(
+    request: Request,
     file: UploadFile = File(...),
     collection_name: str = "default",
-    embedding_model: str = "openai",
-    db: Session = Depends(get_db)
+    embedding_model: str = "local",
+    db: AsyncSession = Depends(get_db)
 ):
     """Upload and process a document"""
     try:
-        # Read file
-        file_bytes = await file.read()
-        
-        # Process document
-        result = doc_processor.process_document(file_bytes, file.filename)
+        # Copy the upload to disk so MuPDF can open it by path
+        tmp = await asyncio.to_thread(spool_upload, file.file)
+        with tmp:
+            # Parse and chunk off the event loop, capped at one job per core
+            async with processing_semaphore:
+                result = await asyncio.to_thread(
+                    request.app.state.doc_processor.process_document, tmp.name, file.filename
+                )
         
         # Store in database
         doc = Document(
             filename=result["filename"],
             content=result["text"],
-            metadata={"chunk_count": result["chunk_count"]}
+            meta={"chunk_count": result["chunk_count"]}
         )
         db.add(doc)
-        db.commit()
+        await db.commit()
         
         # Add to vector store
-        embedding_result = embedding_service.add_documents(
+        embedding_result = await request.app.state.embedding_service.add_documents(
             collection_name=collection_name,
             chunks=result["chunks"],
             embedding_model=embedding_model
@@ -74,7 +134,7 @@ async def upload_document(
 @app.post("/api/workflows/save")
 async def save_workflow(
     workflow_data: Dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Save a workflow"""
     workflow = Workflow(
@@ -84,14 +144,15 @@ async def save_workflow(
         config=workflow_data.get("config", {})
     )
     db.add(workflow)
-    db.commit()
+    await db.commit()
     
     return {"status": "success", "workflow_id": workflow.id}
 
 @app.get("/api/workflows/{workflow_id}")
-async def get_workflow(workflow_id: int, db: Session = Depends(get_db)):
+async def get_workflow(workflow_id: int, db: AsyncSession = Depends(get_db)):
     """Get a workflow by ID"""
-    workflow = db.query(Workflow).filter(Workflow.id == workflow_id).first()
+    result = await db.execute(select(Workflow).where(Workflow.id == workflow_id))
+    workflow = result.scalars().first()
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
     
@@ -105,12 +166,13 @@ async def get_workflow(workflow_id: int, db: Session = Depends(get_db)):
 
 @app.post("/api/workflows/execute")
 async def execute_workflow(
+    request: Request,
     execution_data: Dict,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Execute a workflow"""
     try:
-        result = await workflow_executor.execute_workflow(
+        result = await request.app.state.workflow_executor.execute_workflow(
             query=execution_data["query"],
             nodes=execution_data["nodes"],
             edges=execution_data["edges"],
@@ -119,39 +181,68 @@ async def execute_workflow(
         
         # Save chat history
         if execution_data.get("workflow_id"):
-            chat_user = ChatHistory(
-                workflow_id=execution_data["workflow_id"],
-                role="user",
-                content=execution_data["query"]
-            )
-            chat_assistant = ChatHistory(
-                workflow_id=execution_data["workflow_id"],
-                role="assistant",
-                content=result["response"],
-                metadata=result.get("metadata", {})
-            )
-            db.add(chat_user)
-            db.add(chat_assistant)
-            db.commit()
+            await save_chat_history(db, execution_data["workflow_id"], execution_data["query"], result)
         
         return result
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/workflows/execute/stream")
+async def execute_workflow_stream(request: Request, execution_data: Dict):
+    """Execute a workflow, streaming the response as server-sent events"""
+    workflow_executor = request.app.state.workflow_executor
+    
+    async def events():
+        try:
+            state = workflow_executor.create_state(execution_data["query"])
+            async for text in workflow_executor.run_workflow(
+                state,
+                nodes=execution_data["nodes"],
+                edges=execution_data["edges"],
+                node_configs=execution_data.get("nodeConfigs", {}),
+                stream=True
+            ):
+                yield format_event({"type": "token", "content": text})
+            
+            # Save chat history once the full response is known
+            if execution_data.get("workflow_id"):
+                async with SessionLocal() as db:
+                    await save_chat_history(db, execution_data["workflow_id"], execution_data["query"], state)
+        
+        except Exception as e:
+            yield format_event({"type": "error", "detail": str(e)})
+            return
+        
+        yield format_event({
+            "type": "done",
+            "response": state["response"],
+            "metadata": state.get("metadata", {})
+        })
+    
+    # Keep proxies from buffering the stream and delaying the first token
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/chat/history/{workflow_id}")
-async def get_chat_history(workflow_id: int, db: Session = Depends(get_db)):
+async def get_chat_history(workflow_id: int, db: AsyncSession = Depends(get_db)):
     """Get chat history for a workflow"""
-    history = db.query(ChatHistory).filter(
-        ChatHistory.workflow_id == workflow_id
-    ).order_by(ChatHistory.created_at).all()
+    result = await db.execute(
+        select(ChatHistory.role, ChatHistory.content, ChatHistory.created_at)
+        .where(ChatHistory.workflow_id == workflow_id)
+        .order_by(ChatHistory.created_at)
+    )
     
     return [{
-        "role": msg.role,
-        "content": msg.content,
-        "created_at": msg.created_at.isoformat()
-    } for msg in history]
+        "role": role,
+        "content": content,
+        "created_at": created_at
+    } for role, content, created_at in result]
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Single process for local runs; multi-worker deployments use gunicorn.conf.py
+    uvicorn.run("main:app", host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -7,40 +7,42 @@ class DocumentProcessor:
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
     
-    def extract_text_from_pdf(self, file_bytes: bytes) -> str:
-        """Extract text from PDF bytes"""
-        doc = fitz.open(stream=file_bytes, filetype="pdf")
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        doc.close()
-        return text
+    def extract_text_from_pdf(self, file_path: str) -> str:
+        """Extract text from a PDF file on disk"""
+        doc = fitz.open(file_path, filetype="pdf")
+        try:
+            pages = [page.get_text("text") for page in doc]
+        finally:
+            doc.close()
+        return "".join(pages)
     
     def chunk_text(self, text: str) -> List[Dict[str, any]]:
         """Split text into chunks with overlap"""
-        chunks = []
-        start = 0
         text_length = len(text)
+        starts = range(0, text_length, self.chunk_size - self.chunk_overlap)
+        
+        # ASCII character offsets are byte offsets, so encode once and hash slices
+        data = memoryview(text.encode("ascii")) if text.isascii() else None
         
-        while start < text_length:
-            end = start + self.chunk_size
+        chunks = []
+        for start in starts:
+            end = min(start + self.chunk_size, text_length)
             chunk = text[start:end]
+            chunk_bytes = data[start:end] if data is not None else chunk.encode()
             
-            chunk_id = hashlib.md5(chunk.encode()).hexdigest()
+            chunk_id = hashlib.blake2b(chunk_bytes, digest_size=16).hexdigest()
             chunks.append({
                 "id": chunk_id,
                 "content": chunk,
                 "start": start,
-                "end": min(end, text_length)
+                "end": end
             })
-            
-            start += self.chunk_size - self.chunk_overlap
         
         return chunks
     
-    def process_document(self, file_bytes: bytes, filename: str) -> Dict:
+    def process_document(self, file_path: str, filename: str) -> Dict:
         """Process a document and return chunks"""
-        text = self.extract_text_from_pdf(file_bytes)
+        text = self.extract_text_from_pdf(file_path)
         chunks = self.chunk_text(text)
         
         return {
@@ -0,0 +1,67 @@
+import redis.asyncio as redis
+from collections import OrderedDict
+from typing import List, Optional
+import hashlib
+import json
+import os
+
+class EmbeddingCache:
+    """Content-addressed embedding cache backed by Redis, or in-process when no Redis is configured"""
+    
+    def __init__(self, maxsize: int = 10_000, ttl: int = 86400):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.local = OrderedDict()
+        
+        redis_url = os.getenv("REDIS_URL")
+        self.redis = redis.from_url(redis_url) if redis_url else None
+    
+    async def close(self):
+        """Close the Redis connection pool"""
+        if self.redis is not None:
+            await self.redis.aclose()
+    
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """Build the cache key for a text embedded with a given model"""
+        digest = hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+        return f"emb:{model}:{digest}"
+    
+    async def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up cached embeddings, returning None for misses"""
+        keys = [self.make_key(model, text) for text in texts]
+        
+        if self.redis is not None:
+            try:
+                values = await self.redis.mget(keys)
+                return [json.loads(v) if v is not None else None for v in values]
+            except redis.RedisError:
+                pass
+        
+        results = []
+        for key in keys:
+            embedding = self.local.get(key)
+            if embedding is not None:
+                self.local.move_to_end(key)
+            results.append(embedding)
+        return results
+    
+    async def set_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        """Store embeddings for the given texts"""
+        items = {self.make_key(model, t): e for t, e in zip(texts, embeddings)}
+        
+        if self.redis is not None:
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for key, embedding in items.items():
+                        pipe.set(key, json.dumps(embedding), ex=self.ttl)
+                    await pipe.execute()
+                return
+            except redis.RedisError:
+                pass
+        
+        for key, embedding in items.items():
+            self.local[key] = embedding
+            self.local.move_to_end(key)
+        while len(self.local) > self.maxsize:
+            self.local.popitem(last=False)
\ No newline at end of file
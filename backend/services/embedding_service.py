@@ -2,42 +2,154 @@ import chromadb
 from chromadb.config import Settings
 import openai
 import google.generativeai as genai
-from typing import List, Dict
+from sentence_transformers import SentenceTransformer
+from typing import List, Dict, Optional
+from functools import lru_cache
+import asyncio
 import os
+import threading
+
+from .embedding_cache import EmbeddingCache
+from .semantic_cache import SemanticQueryCache
+
+OPENAI_BATCH_SIZE = 256
+OPENAI_CONCURRENCY = 4
+GEMINI_CONCURRENCY = 16
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+LOCAL_BATCH_SIZE = 64
+# torch already spreads each encode across all cores
+LOCAL_CONCURRENCY = 1
+OPENAI_EMBEDDING_MODEL = "text-embedding-ada-002"
+GEMINI_EMBEDDING_MODEL = "models/embedding-001"
+
+def resolve_model_id(embedding_model: str) -> str:
+    """Map an embedding_model option to the concrete model it selects"""
+    if embedding_model == "local":
+        return LOCAL_EMBEDDING_MODEL
+    elif embedding_model == "openai":
+        return OPENAI_EMBEDDING_MODEL
+    return GEMINI_EMBEDDING_MODEL
+
+@lru_cache(maxsize=1)
+def get_local_model() -> SentenceTransformer:
+    """Load the local embedding model once per process"""
+    return SentenceTransformer(LOCAL_EMBEDDING_MODEL)
 
 class EmbeddingService:
     def __init__(self):
-        chroma_host = os.getenv("CHROMA_HOST", "localhost")
-        chroma_port = os.getenv("CHROMA_PORT", "8000")
+        self.chroma_host = os.getenv("CHROMA_HOST", "localhost")
+        self.chroma_port = os.getenv("CHROMA_PORT", "8000")
         
-        self.chroma_client = chromadb.HttpClient(
-            host=chroma_host,
-            port=int(chroma_port)
-        )
+        # HttpClient contacts the server on construction, so it is built on first use
+        self.chroma = None
+        self.chroma_lock = threading.Lock()
         
-        openai.api_key = os.getenv("OPENAI_API_KEY")
+        self.openai_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        self.local_semaphore = asyncio.Semaphore(LOCAL_CONCURRENCY)
+        self.openai_semaphore = asyncio.Semaphore(OPENAI_CONCURRENCY)
+        self.gemini_semaphore = asyncio.Semaphore(GEMINI_CONCURRENCY)
+        self.cache = EmbeddingCache()
+        self.query_cache = SemanticQueryCache(redis_client=self.cache.redis)
     
-    def get_openai_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings using OpenAI"""
-        response = openai.embeddings.create(
-            model="text-embedding-ada-002",
-            input=texts
-        )
-        return [item.embedding for item in response.data]
+    @property
+    def chroma_client(self) -> chromadb.HttpClient:
+        """Connect to Chroma, reusing the client once a connection has succeeded"""
+        with self.chroma_lock:
+            if self.chroma is None:
+                self.chroma = chromadb.HttpClient(
+                    host=self.chroma_host,
+                    port=int(self.chroma_port)
+                )
+            return self.chroma
+    
+    def warmup(self):
+        """Load the local model and open the Chroma connection before serving requests"""
+        get_local_model().encode(["warmup"])
+        try:
+            self.chroma_client.heartbeat()
+        except Exception:
+            # Chroma may still be starting; the client is connected on first use instead
+            pass
+    
+    async def close(self):
+        """Close the embedding cache and OpenAI clients"""
+        await self.cache.close()
+        await self.openai_client.close()
+    
+    async def get_openai_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings using OpenAI, batching inputs concurrently"""
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            async with self.openai_semaphore:
+                response = await self.openai_client.embeddings.create(
+                    model=OPENAI_EMBEDDING_MODEL,
+                    input=batch
+                )
+            return [item.embedding for item in response.data]
+        
+        batches = await asyncio.gather(*[
+            embed_batch(texts[i:i + OPENAI_BATCH_SIZE])
+            for i in range(0, len(texts), OPENAI_BATCH_SIZE)
+        ])
+        return [embedding for batch in batches for embedding in batch]
+    
+    async def get_gemini_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings using Gemini, fanning out requests concurrently"""
+        async def embed(text: str) -> List[float]:
+            async with self.gemini_semaphore:
+                result = await asyncio.to_thread(
+                    genai.embed_content,
+                    model=GEMINI_EMBEDDING_MODEL,
+                    content=text,
+                    task_type="retrieval_document"
+                )
+            return result['embedding']
+        
+        return list(await asyncio.gather(*[embed(text) for text in texts]))
     
-    def get_gemini_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings using Gemini"""
+    async def get_local_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings with the local sentence-transformers model"""
         embeddings = []
-        for text in texts:
-            result = genai.embed_content(
-                model="models/embedding-001",
-                content=text,
-                task_type="retrieval_document"
-            )
-            embeddings.append(result['embedding'])
+        # Encode one batch at a time so queries can interleave with a large upload
+        for i in range(0, len(texts), LOCAL_BATCH_SIZE):
+            async with self.local_semaphore:
+                batch = await asyncio.to_thread(
+                    get_local_model().encode,
+                    texts[i:i + LOCAL_BATCH_SIZE],
+                    batch_size=LOCAL_BATCH_SIZE,
+                    normalize_embeddings=True,
+                    convert_to_numpy=True
+                )
+            embeddings.extend(batch.tolist())
+        return embeddings
+    
+    async def get_embeddings(self, texts: List[str], embedding_model: str = "local") -> List[List[float]]:
+        """Generate embeddings, only calling the provider for texts not already cached"""
+        model_id = resolve_model_id(embedding_model)
+        embeddings = await self.cache.get_many(model_id, texts)
+        misses = list(dict.fromkeys(t for t, e in zip(texts, embeddings) if e is None))
+        
+        if misses:
+            if embedding_model == "local":
+                computed = await self.get_local_embeddings(misses)
+            elif embedding_model == "openai":
+                computed = await self.get_openai_embeddings(misses)
+            else:
+                computed = await self.get_gemini_embeddings(misses)
+            await self.cache.set_many(model_id, misses, computed)
+            
+            computed_by_text = dict(zip(misses, computed))
+            embeddings = [
+                e if e is not None else computed_by_text[t]
+                for t, e in zip(texts, embeddings)
+            ]
+        
         return embeddings
     
+    async def embed_query(self, query_text: str, embedding_model: str = "local") -> List[float]:
+        """Generate the embedding for a single query"""
+        return (await self.get_embeddings([query_text], embedding_model))[0]
+    
     def create_collection(self, collection_name: str):
         """Create or get a collection"""
         try:
@@ -45,52 +157,84 @@ class EmbeddingService:
         except:
             return self.chroma_client.get_collection(name=collection_name)
     
-    def add_documents(
+    async def add_documents(
         self, 
         collection_name: str, 
         chunks: List[Dict],
-        embedding_model: str = "openai"
+        embedding_model: str = "local"
     ):
         """Add documents to ChromaDB"""
-        collection = self.create_collection(collection_name)
+        collection = await asyncio.to_thread(self.create_collection, collection_name)
         
         texts = [chunk["content"] for chunk in chunks]
         ids = [chunk["id"] for chunk in chunks]
         
-        if embedding_model == "openai":
-            embeddings = self.get_openai_embeddings(texts)
-        else:
-            embeddings = self.get_gemini_embeddings(texts)
+        embeddings = await self.get_embeddings(texts, embedding_model)
         
-        collection.add(
+        await asyncio.to_thread(
+            collection.add,
             embeddings=embeddings,
             documents=texts,
             ids=ids
         )
+        await self.query_cache.invalidate(collection_name)
         
         return {"status": "success", "count": len(chunks)}
     
-    def query_collection(
+    async def query_collection(
         self, 
         collection_name: str, 
         query_text: str,
-        embedding_model: str = "openai",
-        n_results: int = 3
+        embedding_model: str = "local",
+        n_results: int = 3,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict]:
-        """Query the collection"""
-        collection = self.chroma_client.get_collection(name=collection_name)
+        """Query the collection, reusing a precomputed query embedding if given"""
+        if query_embedding is None:
+            query_embedding = await self.embed_query(query_text, embedding_model)
         
-        if embedding_model == "openai":
-            query_embedding = self.get_openai_embeddings([query_text])[0]
-        else:
-            query_embedding = self.get_gemini_embeddings([query_text])[0]
+        results = await self.query_collection_many(
+            collection_name=collection_name,
+            query_texts=[query_text],
+            embedding_model=embedding_model,
+            n_results=n_results,
+            query_embeddings=[query_embedding]
+        )
+        return results[0]
+    
+    async def query_collection_many(
+        self,
+        collection_name: str,
+        query_texts: List[str],
+        embedding_model: str = "local",
+        n_results: int = 3,
+        query_embeddings: Optional[List[List[float]]] = None
+    ) -> List[List[Dict]]:
+        """Query the collection with several queries in a single round-trip"""
+        if query_embeddings is None:
+            query_embeddings = await self.get_embeddings(query_texts, embedding_model)
         
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results
+        cache_key = await self.query_cache.cache_key(
+            collection_name, resolve_model_id(embedding_model), n_results
         )
+        documents = [self.query_cache.lookup(cache_key, e) for e in query_embeddings]
+        misses = [i for i, d in enumerate(documents) if d is None]
+        
+        if misses:
+            collection = await asyncio.to_thread(
+                lambda: self.chroma_client.get_collection(name=collection_name)
+            )
+            results = await asyncio.to_thread(
+                collection.query,
+                query_embeddings=[query_embeddings[i] for i in misses],
+                n_results=n_results
+            )
+            
+            for i, docs, dists in zip(misses, results['documents'], results['distances']):
+                documents[i] = [{
+                    "content": doc,
+                    "distance": dist
+                } for doc, dist in zip(docs, dists)]
+                self.query_cache.store(cache_key, query_embeddings[i], documents[i])
         
-        return [{
-            "content": doc,
-            "distance": dist
-        } for doc, dist in zip(results['documents'][0], results['distances'][0])]
\ No newline at end of file
+        return documents
\ No newline at end of file
@@ -2,14 +2,24 @@ import openai
 import google.generativeai as genai
 import httpx
 import os
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 class LLMService:
     def __init__(self):
-        openai.api_key = os.getenv("OPENAI_API_KEY")
+        self.openai_client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
         self.serpapi_key = os.getenv("SERPAPI_KEY")
         self.brave_api_key = os.getenv("BRAVE_API_KEY")
+        self.http = httpx.AsyncClient(
+            http2=True,
+            timeout=10.0,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+        )
+    
+    async def close(self):
+        """Close the shared HTTP clients"""
+        await self.http.aclose()
+        await self.openai_client.close()
     
     async def web_search(self, query: str, provider: str = "serpapi") -> str:
         """Perform web search"""
@@ -25,21 +35,51 @@ class LLMService:
             params = {"q": query}
             headers = {"X-Subscription-Token": self.brave_api_key}
         
-        async with httpx.AsyncClient() as client:
-            if provider == "serpapi":
-                response = await client.get(url, params=params)
-            else:
-                response = await client.get(url, params=params, headers=headers)
-            
-            data = response.json()
-            
-            # Extract results
-            if provider == "serpapi":
-                results = data.get("organic_results", [])
-                return "\n".join([f"{r.get('title')}: {r.get('snippet')}" for r in results[:3]])
-            else:
-                results = data.get("web", {}).get("results", [])
-                return "\n".join([f"{r.get('title')}: {r.get('description')}" for r in results[:3]])
+        if provider == "serpapi":
+            response = await self.http.get(url, params=params)
+        else:
+            response = await self.http.get(url, params=params, headers=headers)
+        
+        data = response.json()
+        
+        # Extract results
+        if provider == "serpapi":
+            results = data.get("organic_results", [])
+            return "\n".join([f"{r.get('title')}: {r.get('snippet')}" for r in results[:3]])
+        else:
+            results = data.get("web", {}).get("results", [])
+            return "\n".join([f"{r.get('title')}: {r.get('description')}" for r in results[:3]])
+    
+    async def build_prompt(
+        self,
+        query: str,
+        context: Optional[str] = None,
+        enable_web_search: bool = False,
+        search_provider: str = "serpapi",
+        web_context: Optional[str] = None
+    ) -> Tuple[str, Optional[str]]:
+        """Build the prompt, returning it along with any web search results used"""
+        prompt = query
+        if context:
+            prompt = f"Context:\n{context}\n\nQuestion: {query}"
+        
+        # Add web search if enabled, reusing results fetched ahead of time
+        if enable_web_search:
+            if web_context is None:
+                web_context = await self.web_search(query, search_provider)
+            prompt = f"Web Search Results:\n{web_context}\n\n{prompt}"
+        else:
+            web_context = None
+        
+        return prompt, web_context
+    
+    def build_messages(self, prompt: str, system_prompt: Optional[str] = None) -> List[Dict]:
+        """Build OpenAI chat messages"""
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        return messages
     
     async def generate_response(
         self,
@@ -50,31 +90,20 @@ class LLMService:
         model: str = "gpt-4",
         temperature: float = 0.7,
         enable_web_search: bool = False,
-        search_provider: str = "serpapi"
+        search_provider: str = "serpapi",
+        web_context: Optional[str] = None
     ) -> Dict:
         """Generate LLM response"""
         
-        # Build prompt
-        prompt = query
-        if context:
-            prompt = f"Context:\n{context}\n\nQuestion: {query}"
-        
-        # Add web search if enabled
-        web_context = None
-        if enable_web_search:
-            web_context = await self.web_search(query, search_provider)
-            prompt = f"Web Search Results:\n{web_context}\n\n{prompt}"
+        prompt, web_context = await self.build_prompt(
+            query, context, enable_web_search, search_provider, web_context
+        )
         
         # Generate response
         if provider == "openai":
-            messages = []
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-            messages.append({"role": "user", "content": prompt})
-            
-            response = openai.chat.completions.create(
+            response = await self.openai_client.chat.completions.create(
                 model=model,
-                messages=messages,
+                messages=self.build_messages(prompt, system_prompt),
                 temperature=temperature
             )
             
@@ -86,10 +115,48 @@ class LLMService:
         
         else:  # gemini
             model_instance = genai.GenerativeModel(model)
-            response = model_instance.generate_content(prompt)
+            response = await model_instance.generate_content_async(prompt)
             
             return {
                 "response": response.text,
                 "model": model,
                 "web_context": web_context
-            }
\ No newline at end of file
+            }
+    
+    async def stream_response(
+        self,
+        query: str,
+        context: Optional[str] = None,
+        system_prompt: Optional[str] = None,
+        provider: str = "openai",
+        model: str = "gpt-4",
+        temperature: float = 0.7,
+        enable_web_search: bool = False,
+        search_provider: str = "serpapi",
+        web_context: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Generate LLM response, yielding text as it is produced"""
+        prompt, web_context = await self.build_prompt(
+            query, context, enable_web_search, search_provider, web_context
+        )
+        
+        if provider == "openai":
+            stream = await self.openai_client.chat.completions.create(
+                model=model,
+                messages=self.build_messages(prompt, system_prompt),
+                temperature=temperature,
+                stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        
+        else:  # gemini
+            model_instance = genai.GenerativeModel(model)
+            response = await model_instance.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                # Blocked or empty chunks carry no text parts, and chunk.text raises on them
+                if chunk.candidates:
+                    text = "".join(part.text for part in chunk.candidates[0].content.parts)
+                    if text:
+                        yield text
\ No newline at end of file
@@ -0,0 +1,110 @@
+import numpy as np
+import redis.asyncio as redis
+from typing import Dict, List, Optional, Tuple
+import itertools
+import time
+
+class SemanticQueryCache:
+    """Caches retrieval results for near-duplicate queries by cosine similarity of their embeddings"""
+    
+    def __init__(
+        self,
+        redis_client: Optional[redis.Redis] = None,
+        threshold: float = 0.97,
+        maxsize: int = 1024,
+        ttl: int = 3600
+    ):
+        self.redis = redis_client
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.partitions: Dict[Tuple, Dict] = {}
+        self.clock = itertools.count()
+    
+    @staticmethod
+    def normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    @staticmethod
+    def generation_key(collection_name: str) -> str:
+        return f"qgen:{collection_name}"
+    
+    async def cache_key(self, collection_name: str, model: str, n_results: int) -> Optional[Tuple]:
+        """Build the cache key for the collection's current generation, or None if caching is unavailable"""
+        # The generation lives in Redis so writes on any worker invalidate every
+        # worker; without Redis that is impossible, so caching is disabled
+        if self.redis is None:
+            return None
+        
+        try:
+            generation = await self.redis.get(self.generation_key(collection_name))
+        except redis.RedisError:
+            return None
+        return (collection_name, model, n_results, int(generation or 0))
+    
+    def lookup(self, key: Optional[Tuple], embedding: List[float]) -> Optional[List[Dict]]:
+        """Return cached results for the closest stored query, if it is similar enough"""
+        partition = self.partitions.get(key) if key is not None else None
+        if partition is None:
+            return None
+        
+        scores = partition["vectors"] @ self.normalize(embedding)
+        scores[partition["stored_at"] < time.monotonic() - self.ttl] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        
+        partition["last_used"][best] = next(self.clock)
+        return partition["results"][best]
+    
+    def store(self, key: Optional[Tuple], embedding: List[float], results: List[Dict]):
+        """Remember the results for a query, evicting the least recently used entry when full"""
+        if key is None:
+            return
+        
+        # A slow query may finish after the collection moved on; its results are already stale
+        generations = [k[-1] for k in self.partitions if k[:-1] == key[:-1]]
+        if any(generation > key[-1] for generation in generations):
+            return
+        
+        vector = self.normalize(embedding)
+        now = time.monotonic()
+        partition = self.partitions.get(key)
+        
+        if partition is None or partition["vectors"].shape[1] != vector.shape[0]:
+            # Entries from older generations of this collection can no longer be hit
+            for stale in [k for k in self.partitions if k[:-1] == key[:-1] and k[-1] < key[-1]]:
+                del self.partitions[stale]
+            
+            self.partitions[key] = {
+                "vectors": vector[np.newaxis, :],
+                "results": [results],
+                "last_used": np.array([next(self.clock)], dtype=np.int64),
+                "stored_at": np.array([now], dtype=np.float64)
+            }
+            return
+        
+        if len(partition["results"]) < self.maxsize:
+            partition["vectors"] = np.vstack([partition["vectors"], vector])
+            partition["results"].append(results)
+            partition["last_used"] = np.append(partition["last_used"], next(self.clock))
+            partition["stored_at"] = np.append(partition["stored_at"], now)
+        else:
+            oldest = int(np.argmin(partition["last_used"]))
+            partition["vectors"][oldest] = vector
+            partition["results"][oldest] = results
+            partition["last_used"][oldest] = next(self.clock)
+            partition["stored_at"][oldest] = now
+    
+    async def invalidate(self, collection_name: str):
+        """Drop cached results for a collection whose contents changed, across all workers"""
+        for key in [k for k in self.partitions if k[0] == collection_name]:
+            del self.partitions[key]
+        
+        if self.redis is not None:
+            try:
+                await self.redis.incr(self.generation_key(collection_name))
+            except redis.RedisError:
+                pass
\ No newline at end of file
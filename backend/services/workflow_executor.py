@@ -1,62 +1,146 @@
-from typing import Dict, List
+from typing import AsyncIterator, Awaitable, Dict, List, Optional, Tuple
+from functools import lru_cache
+import asyncio
 from .document_processor import DocumentProcessor
 from .embedding_service import EmbeddingService
 from .llm_service import LLMService
 
+@lru_cache(maxsize=256)
+def compute_execution_order(
+    node_types: Tuple[Tuple[str, str], ...],
+    edges: Tuple[Tuple[str, str], ...]
+) -> Tuple[str, ...]:
+    """Topologically order a workflow graph, memoized per graph shape"""
+    # Create adjacency list
+    graph = {node_id: [] for node_id, _ in node_types}
+    for source, target in edges:
+        graph[source].append(target)
+    
+    # Find start node (userQuery)
+    start_node = next((node_id for node_id, component_type in node_types if component_type == 'userQuery'), None)
+    
+    if not start_node:
+        raise ValueError("No User Query component found")
+    
+    # Simple topological order (iterative DFS)
+    order = []
+    visited = set()
+    stack = [start_node]
+    
+    while stack:
+        node_id = stack.pop()
+        if node_id in visited:
+            continue
+        visited.add(node_id)
+        order.append(node_id)
+        stack.extend(reversed(graph.get(node_id, [])))
+    
+    return tuple(order)
+
 class WorkflowExecutor:
-    def __init__(self):
+    def __init__(
+        self,
+        embedding_service: Optional[EmbeddingService] = None,
+        llm_service: Optional[LLMService] = None
+    ):
         self.doc_processor = DocumentProcessor()
-        self.embedding_service = EmbeddingService()
-        self.llm_service = LLMService()
+        self.embedding_service = embedding_service or EmbeddingService()
+        self.llm_service = llm_service or LLMService()
     
     def build_execution_order(self, nodes: List[Dict], edges: List[Dict]) -> List[str]:
         """Build execution order from nodes and edges"""
-        # Create adjacency list
-        graph = {node['id']: [] for node in nodes}
-        for edge in edges:
-            graph[edge['source']].append(edge['target'])
-        
-        # Find start node (userQuery)
-        start_node = next((n['id'] for n in nodes if n['data']['componentType'] == 'userQuery'), None)
-        
-        if not start_node:
-            raise ValueError("No User Query component found")
-        
-        # Simple topological order (DFS)
-        order = []
-        visited = set()
-        
-        def dfs(node_id):
-            if node_id in visited:
-                return
-            visited.add(node_id)
-            order.append(node_id)
-            for neighbor in graph.get(node_id, []):
-                dfs(neighbor)
+        node_types = tuple((n['id'], n['data']['componentType']) for n in nodes)
+        edge_pairs = tuple((e['source'], e['target']) for e in edges)
+        return list(compute_execution_order(node_types, edge_pairs))
+    
+    async def retrieve_context(
+        self,
+        query: str,
+        config: Dict,
+        query_embedding: Optional[Awaitable[List[float]]] = None
+    ) -> Optional[str]:
+        """Retrieve context from vector store for a knowledge base node"""
+        collection_name = config.get('collectionName', 'default')
+        embedding_model = config.get('embeddingModel', 'local')
         
-        dfs(start_node)
-        return order
+        try:
+            results = await self.embedding_service.query_collection(
+                collection_name=collection_name,
+                query_text=query,
+                embedding_model=embedding_model,
+                n_results=3,
+                query_embedding=await query_embedding if query_embedding is not None else None
+            )
+            return "\n\n".join([r["content"] for r in results])
+        except:
+            return None
     
-    async def execute_workflow(
+    async def prefetch(
         self,
         query: str,
-        nodes: List[Dict],
-        edges: List[Dict],
+        execution_order: List[str],
+        node_by_id: Dict[str, Dict],
         node_configs: Dict
-    ) -> Dict:
-        """Execute the workflow"""
+    ) -> Dict[str, Optional[str]]:
+        """Run knowledge base retrieval and web search concurrently, keyed by node id"""
+        node_ids = []
+        tasks = []
+        query_embeddings = {}
+        retrievals = {}
         
-        execution_order = self.build_execution_order(nodes, edges)
+        for node_id in execution_order:
+            component_type = node_by_id[node_id]['data']['componentType']
+            config = node_configs.get(node_id, {})
+            
+            if component_type == 'knowledgeBase':
+                # Embed the query once per model and share it across knowledge base nodes
+                embedding_model = config.get('embeddingModel', 'local')
+                if embedding_model not in query_embeddings:
+                    query_embeddings[embedding_model] = asyncio.ensure_future(
+                        self.embedding_service.embed_query(query, embedding_model)
+                    )
+                
+                # Nodes reading the same collection with the same model share one Chroma query
+                retrieval_key = (config.get('collectionName', 'default'), embedding_model)
+                if retrieval_key not in retrievals:
+                    retrievals[retrieval_key] = asyncio.ensure_future(
+                        self.retrieve_context(query, config, query_embeddings[embedding_model])
+                    )
+                tasks.append(retrievals[retrieval_key])
+            elif component_type == 'llmEngine' and config.get('enableWebSearch', False):
+                tasks.append(self.llm_service.web_search(query, config.get('searchProvider', 'serpapi')))
+            else:
+                continue
+            node_ids.append(node_id)
         
-        # Track execution state
-        state = {
+        return dict(zip(node_ids, await asyncio.gather(*tasks)))
+    
+    def create_state(self, query: str) -> Dict:
+        """Create the initial execution state for a query"""
+        return {
             "query": query,
             "context": None,
             "response": None
         }
+    
+    async def run_workflow(
+        self,
+        state: Dict,
+        nodes: List[Dict],
+        edges: List[Dict],
+        node_configs: Dict,
+        stream: bool = False
+    ) -> AsyncIterator[str]:
+        """Run the workflow nodes in order, updating state and yielding response text when streaming"""
+        
+        execution_order = self.build_execution_order(nodes, edges)
+        node_by_id = {n['id']: n for n in nodes}
+        
+        # Retrieval and web search only depend on the query, so overlap them
+        prefetched = await self.prefetch(state["query"], execution_order, node_by_id, node_configs)
         
         for node_id in execution_order:
-            node = next(n for n in nodes if n['id'] == node_id)
+            node = node_by_id[node_id]
             component_type = node['data']['componentType']
             config = node_configs.get(node_id, {})
             
@@ -65,33 +149,36 @@ class WorkflowExecutor:
                 pass
             
             elif component_type == 'knowledgeBase':
-                # Retrieve context from vector store
-                collection_name = config.get('collectionName', 'default')
-                embedding_model = config.get('embeddingModel', 'openai')
-                
-                try:
-                    results = self.embedding_service.query_collection(
-                        collection_name=collection_name,
-                        query_text=state["query"],
-                        embedding_model=embedding_model,
-                        n_results=3
-                    )
-                    state["context"] = "\n\n".join([r["content"] for r in results])
-                except:
-                    state["context"] = None
+                # Context was retrieved from vector store during prefetch
+                state["context"] = prefetched[node_id]
             
             elif component_type == 'llmEngine':
                 # Generate response using LLM
-                llm_response = await self.llm_service.generate_response(
-                    query=state["query"],
-                    context=state.get("context"),
-                    system_prompt=config.get('systemPrompt'),
-                    provider=config.get('provider', 'openai'),
-                    model=config.get('model', 'gpt-4'),
-                    temperature=config.get('temperature', 0.7),
-                    enable_web_search=config.get('enableWebSearch', False),
-                    search_provider=config.get('searchProvider', 'serpapi')
-                )
+                options = {
+                    "query": state["query"],
+                    "context": state.get("context"),
+                    "system_prompt": config.get('systemPrompt'),
+                    "provider": config.get('provider', 'openai'),
+                    "model": config.get('model', 'gpt-4'),
+                    "temperature": config.get('temperature', 0.7),
+                    "enable_web_search": config.get('enableWebSearch', False),
+                    "search_provider": config.get('searchProvider', 'serpapi'),
+                    "web_context": prefetched.get(node_id)
+                }
+                
+                if stream:
+                    parts = []
+                    async for text in self.llm_service.stream_response(**options):
+                        parts.append(text)
+                        yield text
+                    llm_response = {
+                        "response": "".join(parts),
+                        "model": options["model"],
+                        "web_context": options["web_context"]
+                    }
+                else:
+                    llm_response = await self.llm_service.generate_response(**options)
+                
                 state["response"] = llm_response["response"]
                 state["metadata"] = {
                     "model": llm_response["model"],
@@ -101,5 +188,16 @@ class WorkflowExecutor:
             elif component_type == 'output':
                 # Format final output
                 pass
-        
+    
+    async def execute_workflow(
+        self,
+        query: str,
+        nodes: List[Dict],
+        edges: List[Dict],
+        node_configs: Dict
+    ) -> Dict:
+        """Execute the workflow"""
+        state = self.create_state(query)
+        async for _ in self.run_workflow(state, nodes, edges, node_configs):
+            pass
         return state
\ No newline at end of file